@@ -0,0 +1,99 @@
+# cython: boundscheck=False, wraparound=False, cdivision=True, language_level=3
+"""Cython implementation of the fitelp.gaussian_residuals kernels (the 'cython' backend)"""
+import numpy as np
+from libc.math cimport exp
+
+cdef double _INV_SQRT_2PI = 0.3989422804014327
+
+
+cdef tuple _component_constants(const double[::1] p, int n):
+    cdef double[::1] centers = np.empty(n)
+    cdef double[::1] invSigmas = np.empty(n)
+    cdef double[::1] norms = np.empty(n)
+    cdef int i
+    for i in range(n):
+        centers[i] = p[2 + 3 * i]
+        invSigmas[i] = 1.0 / p[3 + 3 * i]
+        norms[i] = p[4 + 3 * i] * invSigmas[i] * _INV_SQRT_2PI
+
+    return centers, invSigmas, norms
+
+
+def multi_gaussian_model(const double[::1] p, const double[::1] vel, int n):
+    cdef double[::1] centers, invSigmas, norms
+    centers, invSigmas, norms = _component_constants(p, n)
+    model = np.empty(vel.shape[0])
+    cdef double[::1] modelView = model
+    cdef Py_ssize_t k
+    cdef int i
+    cdef double value, z
+    for k in range(vel.shape[0]):
+        value = p[0] * vel[k] + p[1]
+        for i in range(n):
+            z = (vel[k] - centers[i]) * invSigmas[i]
+            value += norms[i] * exp(-0.5 * z * z)
+        modelView[k] = value
+
+    return model
+
+
+def multi_gaussian_components(const double[::1] p, const double[::1] vel, int n, double[:, ::1] comps):
+    cdef double[::1] centers, invSigmas, norms
+    centers, invSigmas, norms = _component_constants(p, n)
+    model = np.empty(vel.shape[0])
+    cdef double[::1] modelView = model
+    cdef Py_ssize_t k
+    cdef int i
+    cdef double value, z, gauss
+    for k in range(vel.shape[0]):
+        value = p[0] * vel[k] + p[1]
+        comps[0, k] = value
+        for i in range(n):
+            z = (vel[k] - centers[i]) * invSigmas[i]
+            gauss = norms[i] * exp(-0.5 * z * z)
+            comps[i + 1, k] = gauss
+            value += gauss
+        modelView[k] = value
+
+    return model
+
+
+def multi_gaussian_residual(const double[::1] p, const double[::1] vel, const double[::1] flux,
+                            const double[::1] weights, int n, out):
+    cdef double[::1] centers, invSigmas, norms
+    centers, invSigmas, norms = _component_constants(p, n)
+    cdef double[::1] outView = out
+    cdef Py_ssize_t k
+    cdef int i
+    cdef double model, z
+    for k in range(vel.shape[0]):
+        model = p[0] * vel[k] + p[1]
+        for i in range(n):
+            z = (vel[k] - centers[i]) * invSigmas[i]
+            model += norms[i] * exp(-0.5 * z * z)
+        outView[k] = (flux[k] - model) * weights[k]
+
+    return out
+
+
+def multi_gaussian_jacobian(const double[::1] p, const double[::1] vel, const double[::1] flux,
+                            const double[::1] weights, int n):
+    cdef double[::1] centers, invSigmas, norms
+    centers, invSigmas, norms = _component_constants(p, n)
+    jac = np.empty((vel.shape[0], 2 + 3 * n))
+    cdef double[:, ::1] jacView = jac
+    cdef Py_ssize_t k
+    cdef int i
+    cdef double z, expTerm, gauss
+    for k in range(vel.shape[0]):
+        jacView[k, 0] = -vel[k] * weights[k]
+        jacView[k, 1] = -weights[k]
+        for i in range(n):
+            z = (vel[k] - centers[i]) * invSigmas[i]
+            expTerm = exp(-0.5 * z * z) * weights[k]
+            gauss = norms[i] * expTerm
+            jacView[k, 2 + 3 * i] = -gauss * z * invSigmas[i]
+            jacView[k, 3 + 3 * i] = -gauss * (z * z - 1.0) * invSigmas[i]
+            jacView[k, 4 + 3 * i] = -expTerm * invSigmas[i] * _INV_SQRT_2PI
+
+    return jac
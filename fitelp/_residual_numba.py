@@ -0,0 +1,79 @@
+"""Numba implementation of the fitelp.gaussian_residuals kernels (the 'numba' backend)"""
+import numpy as np
+from numba import njit
+
+_INV_SQRT_2PI = 0.3989422804014327
+
+
+@njit(fastmath=True, cache=True, boundscheck=False)
+def _component_constants(p, n):
+    """Returns the center, 1/sigma and amplitude/(sigma*sqrt(2*pi)) of each gaussian component"""
+    centers = np.empty(n)
+    invSigmas = np.empty(n)
+    norms = np.empty(n)
+    for i in range(n):
+        centers[i] = p[2 + 3 * i]
+        invSigmas[i] = 1.0 / p[3 + 3 * i]
+        norms[i] = p[4 + 3 * i] * invSigmas[i] * _INV_SQRT_2PI
+
+    return centers, invSigmas, norms
+
+
+@njit(fastmath=True, cache=True, boundscheck=False)
+def multi_gaussian_model(p, vel, n):
+    centers, invSigmas, norms = _component_constants(p, n)
+    model = p[0] * vel + p[1]
+    for i in range(n):
+        z = (vel - centers[i]) * invSigmas[i]
+        model += norms[i] * np.exp(-0.5 * z * z)
+
+    return model
+
+
+@njit(fastmath=True, cache=True, boundscheck=False)
+def multi_gaussian_components(p, vel, n, comps):
+    centers, invSigmas, norms = _component_constants(p, n)
+    slope, intercept = p[0], p[1]
+    model = np.empty(len(vel))
+    for k in range(len(vel)):
+        value = slope * vel[k] + intercept
+        comps[0, k] = value
+        for i in range(n):
+            z = (vel[k] - centers[i]) * invSigmas[i]
+            gauss = norms[i] * np.exp(-0.5 * z * z)
+            comps[i + 1, k] = gauss
+            value += gauss
+        model[k] = value
+
+    return model
+
+
+@njit(fastmath=True, cache=True, boundscheck=False)
+def multi_gaussian_residual(p, vel, flux, weights, n, out):
+    centers, invSigmas, norms = _component_constants(p, n)
+    slope, intercept = p[0], p[1]
+    for k in range(len(vel)):
+        model = slope * vel[k] + intercept
+        for i in range(n):
+            z = (vel[k] - centers[i]) * invSigmas[i]
+            model += norms[i] * np.exp(-0.5 * z * z)
+        out[k] = (flux[k] - model) * weights[k]
+
+    return out
+
+
+@njit(fastmath=True, cache=True, boundscheck=False)
+def multi_gaussian_jacobian(p, vel, flux, weights, n):
+    centers, invSigmas, norms = _component_constants(p, n)
+    jac = np.empty((len(vel), 2 + 3 * n))
+    jac[:, 0] = -vel * weights
+    jac[:, 1] = -weights
+    for i in range(n):
+        z = (vel - centers[i]) * invSigmas[i]
+        expTerm = np.exp(-0.5 * z * z) * weights
+        gauss = norms[i] * expTerm
+        jac[:, 2 + 3 * i] = -gauss * z * invSigmas[i]
+        jac[:, 3 + 3 * i] = -gauss * (z * z - 1.0) * invSigmas[i]
+        jac[:, 4 + 3 * i] = -expTerm * invSigmas[i] * _INV_SQRT_2PI
+
+    return jac
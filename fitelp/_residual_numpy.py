@@ -0,0 +1,52 @@
+"""NumPy implementation of the fitelp.gaussian_residuals kernels (the 'numpy' backend)"""
+import numpy as np
+
+_INV_SQRT_2PI = 0.3989422804014327
+
+
+def _gaussian_terms(p, vel, n):
+    """Returns z = (vel - center)/sigma and exp(-z**2/2) of shape (n, len(vel)), 1/sigma and amplitude/(sigma*sqrt(2*pi))"""
+    centers, sigmas, amplitudes = p[2:2 + 3 * n].reshape(n, 3).T
+    invSigmas = 1.0 / sigmas
+    norms = amplitudes * invSigmas * _INV_SQRT_2PI
+    z = (vel - centers[:, np.newaxis]) * invSigmas[:, np.newaxis]
+    expTerm = np.exp(-0.5 * z * z)
+
+    return z, expTerm, invSigmas, norms
+
+
+def multi_gaussian_model(p, vel, n):
+    _, expTerm, _, norms = _gaussian_terms(p, vel, n)
+
+    return p[0] * vel + p[1] + np.dot(norms, expTerm)
+
+
+def multi_gaussian_components(p, vel, n, comps):
+    _, expTerm, _, norms = _gaussian_terms(p, vel, n)
+    np.multiply(vel, p[0], out=comps[0])
+    comps[0] += p[1]
+    np.multiply(expTerm, norms[:, np.newaxis], out=comps[1:])
+
+    return comps.sum(axis=0)
+
+
+def multi_gaussian_residual(p, vel, flux, weights, n, out):
+    np.subtract(flux, multi_gaussian_model(p, vel, n), out=out)
+    out *= weights
+
+    return out
+
+
+def multi_gaussian_jacobian(p, vel, flux, weights, n):
+    z, expTerm, invSigmas, norms = _gaussian_terms(p, vel, n)
+    expTerm *= weights
+    gauss = norms[:, np.newaxis] * expTerm
+    invSigmas = invSigmas[:, np.newaxis]
+    jac = np.empty((len(vel), 2 + 3 * n))
+    jac[:, 0] = -vel * weights
+    jac[:, 1] = -weights
+    jac[:, 2::3] = (-gauss * z * invSigmas).T
+    jac[:, 3::3] = (-gauss * (z * z - 1.0) * invSigmas).T
+    jac[:, 4::3] = (-expTerm * invSigmas * _INV_SQRT_2PI).T
+
+    return jac
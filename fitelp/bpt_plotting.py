@@ -1,5 +1,4 @@
 import os
-import matplotlib.pyplot as plt
 import numpy as np
 import warnings
 from uncertainties import ufloat, umath, unumpy
@@ -132,6 +131,8 @@ def bpt_plot(rpList, rpBptPoints, globalOnly=False, plot_type='NII'):
 
 
 def bpt_plot_NII(rpList, rpBptPoints, globalOnly=False):
+    import matplotlib.pyplot as plt
+
     plot_lines_and_other_points_NII()
 
     # PLOT BPT POINTS
@@ -166,6 +167,8 @@ def bpt_plot_NII(rpList, rpBptPoints, globalOnly=False):
 
 
 def bpt_plot_SII(rpList, rpBptPoints, globalOnly=False):
+    import matplotlib.pyplot as plt
+
     plot_lines_and_other_points_SII()
 
     # PLOT BPT POINTS
@@ -201,6 +204,8 @@ def bpt_plot_SII(rpList, rpBptPoints, globalOnly=False):
 
 
 def bpt_plot_OI(rpList, rpBptPoints, globalOnly=False):
+    import matplotlib.pyplot as plt
+
     plot_lines_and_other_points_OI()
 
     # PLOT BPT POINTS
@@ -235,6 +240,8 @@ def bpt_plot_OI(rpList, rpBptPoints, globalOnly=False):
 
 
 def bpt_plot_NIIvsSII(rpList, rpBptPoints, globalOnly=False):
+    import matplotlib.pyplot as plt
+
     plot_lines_and_other_points_NIIvsSII()
 
     # PLOT BPT POINTS
@@ -270,6 +277,8 @@ def bpt_plot_NIIvsSII(rpList, rpBptPoints, globalOnly=False):
 
 
 def plot_lines_and_other_points_NII():
+    import matplotlib.pyplot as plt
+
     # PLOT LINES
     plt.figure('BPT_NII')
     # y1: log([OIII]5007/Hbeta) = 0.61 / (log([NII]6584/Halpha) - 0.05) + 1.3  (curve of Kauffmann+03 line)
@@ -326,6 +335,8 @@ def plot_lines_and_other_points_NII():
 
 
 def plot_lines_and_other_points_SII():
+    import matplotlib.pyplot as plt
+
     # https://sites.google.com/site/agndiagnostics/home/bpt
 
     # PLOT LINES
@@ -346,6 +357,8 @@ def plot_lines_and_other_points_SII():
 
 
 def plot_lines_and_other_points_OI():
+    import matplotlib.pyplot as plt
+
     # PLOT LINES
     plt.figure('BPT_OI')
     # y1: log([OIII]/Hb) = 0.73 / (log([OI]/Ha) + 0.59) + 1.33    (main AGN line)
@@ -364,5 +377,7 @@ def plot_lines_and_other_points_OI():
 
 
 def plot_lines_and_other_points_NIIvsSII():
+    import matplotlib.pyplot as plt
+
     # PLOT LINES
     plt.figure('BPT_NIIvsSII')
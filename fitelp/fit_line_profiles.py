@@ -1,45 +1,184 @@
 import os
-import matplotlib.pyplot as plt
-from matplotlib.ticker import MaxNLocator
+import operator
+from collections import OrderedDict
+from functools import reduce
 import numpy as np
-from lmfit import Parameters
-from lmfit.models import GaussianModel, LinearModel
+from scipy.optimize import least_squares, lsq_linear
 from astropy.constants import c
 from fitelp.label_tools import line_label
+from fitelp.gaussian_residuals import get_backend
 import fitelp.constants as constants
 
 constants.init()
 
+# Speed of light in km/s. Converting the astropy constant is slow, so it is only done once.
+SPEED_OF_LIGHT = c.to('km/s').value
+
+# GaussianModels and their default Parameters for each prefix, reused by every lmfit fit
+_GAUSSIAN_MODELS = {}
+_GAUSSIAN_PARAMS = {}
+
 
 def vel_to_wave(restWave, vel, flux, fluxError=None, delta=False):
     if delta is True:
-        wave = (vel / c.to('km/s').value) * restWave
+        wave = (vel / SPEED_OF_LIGHT) * restWave
     else:
-        wave = (vel / c.to('km/s').value) * restWave + restWave
-    flux = flux / (restWave / c.to('km/s').value)
+        wave = (vel / SPEED_OF_LIGHT) * restWave + restWave
+    flux = flux / (restWave / SPEED_OF_LIGHT)
     if fluxError is not None:
-        fluxError = fluxError / (restWave / c.to('km/s').value)
+        fluxError = fluxError / (restWave / SPEED_OF_LIGHT)
         return vel, flux, fluxError
     else:
         return wave, flux
 
 
 def wave_to_vel(restWave, wave, flux, fluxError=None, delta=False):
+    # vel = c * (wave/restWave - 1) computed in place so that only the output array is allocated
+    invRestWave = 1.0 / restWave
     if delta is True:
-        vel = (wave / restWave) * c.to('km/s').value
+        vel = np.multiply(wave, invRestWave * SPEED_OF_LIGHT)
     else:
-        vel = ((wave - restWave) / restWave) * c.to('km/s').value
-    flux = flux * (restWave / c.to('km/s').value)
+        vel = np.multiply(wave, invRestWave)
+        vel -= 1.0
+        vel *= SPEED_OF_LIGHT
+    fluxScale = restWave / SPEED_OF_LIGHT
+    flux = flux * fluxScale
     if fluxError is not None:
-        fluxError = fluxError * (restWave / c.to('km/s').value)
+        fluxError = fluxError * fluxScale
         return vel, flux, fluxError
     else:
         return vel, flux
 
 
+def component_bounds(value, limit):
+    """Returns the increasing (min, max, vary) of a parameter from its compLimits entry (False, tuple or fraction)"""
+    if limit is False:
+        return -np.inf, np.inf, False
+    elif type(limit) is tuple:
+        lower, upper = limit
+    elif np.isinf(limit):
+        return -np.inf, np.inf, True
+    else:
+        lower, upper = value - value * limit, value + value * limit
+
+    if lower == upper:
+        return -np.inf, np.inf, False
+
+    return min(lower, upper), max(lower, upper), True
+
+
+class FitParameter(object):
+    def __init__(self, name, value, stderr=None, vary=True, init_value=None, expr=None):
+        """Best fit value of a single parameter of a LinGaussianFit"""
+        self.name = name
+        self.value = value
+        self.stderr = stderr
+        self.vary = vary
+        self.init_value = init_value
+        self.expr = expr
+
+
+class LinGaussianFit(object):
+    def __init__(self, numOfComponents, x, flux, weights, p0, p, vary, jac, nfev, message, success, kernels):
+        """Least squares fit result with the parts of lmfit's ModelResult used by FitELP"""
+        self.numOfComponents = numOfComponents
+        self.kernels = kernels
+        self.x = x
+        self.nfev = nfev
+        self.message = message
+        self.success = success
+        self._p = p
+
+        self.init_fit = kernels.multi_gaussian_model(p0, x, numOfComponents)
+        # Linear continuum and gaussians of the best fit
+        self._components = np.empty((numOfComponents + 1, len(x)))
+        self.best_fit = kernels.multi_gaussian_components(p, x, numOfComponents, self._components)
+        self.residual = (flux - self.best_fit) * weights
+        self.ndata = len(self.residual)
+        self.nvarys = int(np.count_nonzero(vary))
+        self.nfree = self.ndata - self.nvarys
+        self.chisqr = float(np.sum(self.residual ** 2))
+        self.redchi = self.chisqr / max(self.nfree, 1)
+
+        # Covariance scaled by the reduced chi-square, as in lmfit
+        self.errorbars = True
+        self.covar = np.zeros((len(p), len(p)))
+        try:
+            free = np.flatnonzero(vary)
+            self.covar[np.ix_(free, free)] = np.linalg.inv(np.dot(jac.T, jac)) * self.redchi
+        except np.linalg.LinAlgError:
+            self.errorbars = False
+
+        names = ['lin_slope', 'lin_intercept']
+        for i in range(numOfComponents):
+            names += ['g%d_center' % (i + 1), 'g%d_sigma' % (i + 1), 'g%d_amplitude' % (i + 1)]
+        self.best_values = dict(zip(names, p))
+
+        self.params = OrderedDict()
+        for idx, name in enumerate(names):
+            stderr = float(np.sqrt(self.covar[idx, idx])) if self.errorbars else None
+            self.params[name] = FitParameter(name, p[idx], stderr, bool(vary[idx]), p0[idx])
+        for i in range(numOfComponents):
+            self._add_derived_params(i)
+
+    def _add_derived_params(self, i):
+        """Adds the fwhm and height of gaussian i with uncertainties propagated from the covariance matrix"""
+        iS, iA = 3 + 3 * i, 4 + 3 * i
+        s, a = self._p[iS], self._p[iA]
+        height = a / (s * np.sqrt(2 * np.pi))
+        fwhm = 2 * np.sqrt(2 * np.log(2)) * s
+        heightGrad = np.zeros(len(self._p))
+        heightGrad[iS], heightGrad[iA] = -height / s, 1. / (s * np.sqrt(2 * np.pi))
+        fwhmGrad = np.zeros(len(self._p))
+        fwhmGrad[iS] = fwhm / s
+        prefix = 'g%d_' % (i + 1)
+        for name, value, grad, expr in ((prefix + 'fwhm', fwhm, fwhmGrad, '2.3548200*{0}sigma'),
+                                        (prefix + 'height', height, heightGrad, '{0}amplitude/(sqrt(2*pi)*{0}sigma)')):
+            stderr = float(np.sqrt(np.dot(grad, np.dot(self.covar, grad)))) if self.errorbars else None
+            self.params[name] = FitParameter(name, value, stderr, False, expr=expr.format(prefix))
+
+    def eval_components(self, x=None):
+        """Returns a dictionary of the linear ('lin_') and gaussian ('g1_', 'g2_', ...) components of the best fit"""
+        if x is None:
+            comps = self._components
+        else:
+            x = np.ascontiguousarray(x, dtype=np.float64)
+            comps = np.empty((self.numOfComponents + 1, len(x)))
+            self.kernels.multi_gaussian_components(self._p, x, self.numOfComponents, comps)
+        components = OrderedDict()
+        components['lin_'] = comps[0]
+        for i in range(self.numOfComponents):
+            components['g%d_' % (i + 1)] = comps[i + 1]
+        return components
+
+    def fit_report(self):
+        report = ["[[Fit Statistics]]",
+                  "    # function evals   = %d" % self.nfev,
+                  "    # data points      = %d" % self.ndata,
+                  "    # variables        = %d" % self.nvarys,
+                  "    chi-square         = %.7g" % self.chisqr,
+                  "    reduced chi-square = %.7g" % self.redchi,
+                  "    fit message        = %s" % self.message,
+                  "[[Variables]]"]
+        for name, par in self.params.items():
+            if par.expr is not None:
+                value = "%.7g" % par.value
+                if par.stderr is not None:
+                    value += " +/- %.7g" % par.stderr
+                report.append("    %-15s %s == '%s'" % (name + ':', value, par.expr))
+            elif not par.vary:
+                report.append("    %-15s %.7g (fixed)" % (name + ':', par.value))
+            elif par.stderr is None:
+                report.append("    %-15s %.7g (init = %.7g)" % (name + ':', par.value, par.init_value))
+            else:
+                pct = abs(par.stderr / par.value) * 100 if par.value != 0 else np.inf
+                report.append("    %-15s %.7g +/- %.7g (%.2f%%) (init = %.7g)" % (name + ':', par.value, par.stderr, pct, par.init_value))
+        return "\n".join(report) + "\n"
+
+
 class FittingProfile(object):
-    def __init__(self, wave, flux, restWave, lineName, zone, rp, fluxError=None, xAxis='vel', initVals='vel'):
-        """The input vel and flux must be limited to a single emission line profile"""
+    def __init__(self, wave, flux, restWave, lineName, zone, rp, fluxError=None, xAxis='vel', initVals='vel', vel=None):
+        """The input vel and flux must be limited to a single emission line profile. vel is an optional velocity grid of wave"""
         self.flux = flux
         self.fluxError = fluxError
         self.restWave = restWave
@@ -51,15 +190,18 @@ class FittingProfile(object):
         self.initVals = initVals
 
         if xAxis == 'vel':
-            if fluxError is None:
-                vel, self.flux = wave_to_vel(restWave, wave, flux)
-            else:
-                vel, self.flux, self.fluxError = wave_to_vel(restWave, wave, flux, fluxError)
+            if vel is None:
+                vel = wave_to_vel(restWave, wave, flux=0)[0]
+            # Flux per unit wavelength to flux per unit velocity (as in wave_to_vel)
+            fluxScale = restWave / SPEED_OF_LIGHT
+            self.flux = flux * fluxScale
+            if fluxError is not None:
+                self.fluxError = fluxError * fluxScale
             self.x = vel
         else:
             self.x = wave
 
-        self.linGaussParams = Parameters()
+        self.linGaussParams = None
 
     def _weights(self):
         if self.fluxError is None:
@@ -68,54 +210,39 @@ class FittingProfile(object):
             fluxErrorCR = self.fluxError# - self.continuum
             return 1./fluxErrorCR
 
-    def _get_amplitude(self, numOfComponents, modelFit):
-        amplitudeTotal = 0.
-        for i in range(numOfComponents):
-            amplitudeTotal = amplitudeTotal + modelFit.best_values['g%d_amplitude' % (i+1)]
-        print("Amplitude Total is %f" % amplitudeTotal)
+    def _get_amplitude(self, numOfComponents, modelFit, verbose=False):
+        amplitudes = np.fromiter((modelFit.best_values['g%d_amplitude' % (i + 1)] for i in range(numOfComponents)), dtype=np.float64, count=numOfComponents)
+        amplitudeTotal = amplitudes.sum()
+        if verbose:
+            print("Amplitude Total is %f" % amplitudeTotal)
 
         return amplitudeTotal
 
+    def _log_fit_report(self, out, verbose=False):
+        """Appends the fit report of out to the region's log file and prints it if verbose is True"""
+        title = "######## %s %s Linear and Multi-gaussian Model ##########\n" % (self.rp.regionName, self.lineName)
+        report = out.fit_report()
+        with open(os.path.join(constants.OUTPUT_DIR, self.rp.regionName, "{0}_Log.txt".format(self.rp.regionName)), "a") as f:
+            f.write(title)
+            f.write(report)
+        if verbose:
+            print(title)
+            print(report)
+
     def _gaussian_component(self, pars, prefix, c, s, a, limits):
         """Fits a gaussian with given parameters.
         pars is the lmfit Parameters for the fit, prefix is the label of the gaussian, c is the center, s is sigma,
         a is amplitude. Returns the Gaussian model"""
-        varyCentre = True
-        varySigma = True
-        varyAmp = True
-
-        if limits['c'] is False:
-            varyCentre = False
-            cMin, cMax = -np.inf, np.inf
-        elif type(limits['c']) is tuple:
-            cMin = limits['c'][0]
-            cMax = limits['c'][1]
-        else:
-            cMin = c - c*limits['c']
-            cMax = c + c*limits['c']
-
-        if limits['s'] is False:
-            varySigma = False
-            sMin, sMax = -np.inf, np.inf
-        elif type(limits['s']) is tuple:
-            sMin = limits['s'][0]
-            sMax = limits['s'][1]
-        else:
-            sMin = s - s * limits['s']
-            sMax = s + s * limits['s']
-
-        if limits['a'] is False:
-            varyAmp = False
-            aMin, aMax = -np.inf, np.inf
-        elif type(limits['a']) is tuple:
-            aMin = limits['a'][0]
-            aMax = limits['a'][1]
-        else:
-            aMin = a - a * limits['a']
-            aMax = a + a * limits['a']
-
-        g = GaussianModel(prefix=prefix)
-        pars.update(g.make_params())
+        cMin, cMax, varyCentre = component_bounds(c, limits['c'])
+        sMin, sMax, varySigma = component_bounds(s, limits['s'])
+        aMin, aMax, varyAmp = component_bounds(a, limits['a'])
+
+        if prefix not in _GAUSSIAN_MODELS:
+            from lmfit.models import GaussianModel
+            _GAUSSIAN_MODELS[prefix] = GaussianModel(prefix=prefix)
+            _GAUSSIAN_PARAMS[prefix] = _GAUSSIAN_MODELS[prefix].make_params()
+        g = _GAUSSIAN_MODELS[prefix]
+        pars.update(_GAUSSIAN_PARAMS[prefix].copy())
         if isinstance(c, str):
             pars[prefix + 'center'].set(expr=c, min=cMin, max=cMax, vary=varyCentre)
         else:
@@ -131,17 +258,17 @@ class FittingProfile(object):
 
         return g
 
-    def multiple_close_emission_lines(self, lineNames, cListInit, sListInit, lS, lI):
-        """All lists should be the same length"""
+    def multiple_close_emission_lines(self, lineNames, cListInit, sListInit, lS, lI, plot=False, verbose=False):
+        """All lists should be the same length. The fit is only plotted and saved if plot is True"""
+        # lmfit is only needed for the expression constraints between lines, so it is imported here
+        from lmfit.models import LinearModel
+
         gList = []
 
         # Assume initial parameters are in velocity
 
         lin = LinearModel(prefix='lin_')
-        self.linGaussParams = lin.guess(self.flux, x=self.x)
-        self.linGaussParams.update(lin.make_params())
-        self.linGaussParams['lin_slope'].set(lS, vary=True)
-        self.linGaussParams['lin_intercept'].set(lI, vary=True)
+        self.linGaussParams = lin.make_params(slope=lS, intercept=lI)
 
         for j, lineName in enumerate(lineNames):
             numComps = self.rp.emProfiles[lineName]['numComps']
@@ -187,30 +314,24 @@ class FittingProfile(object):
                 else:
                     prefix = 'g{0}{1}_'.format(lineName.replace('-', ''), i + 1)
                 gList.append(self._gaussian_component(self.linGaussParams, prefix, cList[i], sList[i], aList[i], lims))
-        gList = np.array(gList)
-        mod = lin + gList.sum()
+        mod = reduce(operator.add, gList, lin)
 
         init = mod.eval(self.linGaussParams, x=self.x)
         out = mod.fit(self.flux, self.linGaussParams, x=self.x, weights=self.weights)
-        f = open(os.path.join(constants.OUTPUT_DIR, self.rp.regionName, "{0}_Log.txt".format(self.rp.regionName)), "a")
-        print("######## %s %s Linear and Multi-gaussian Model ##########\n" % (self.rp.regionName, self.lineName))
-        print(out.fit_report())
-        f.write("######## %s %s Linear and Multi-gaussian Model ##########\n" % (self.rp.regionName, self.lineName))
-        f.write(out.fit_report())
-        f.close()
+        self._log_fit_report(out, verbose)
         components = out.eval_components()
 
-        if not hasattr(self.rp, 'plotResiduals'):
-            self.rp.plotResiduals = True
-        numComps = self.rp.emProfiles[lineName]['numComps']
-        self.plot_emission_line(numComps, components, out, self.rp.plotResiduals, lineNames, init=init, scaleFlux=self.rp.scaleFlux)
+        if plot:
+            if not hasattr(self.rp, 'plotResiduals'):
+                self.rp.plotResiduals = True
+            numComps = self.rp.emProfiles[lineName]['numComps']
+            self.plot_emission_line(numComps, components, out, self.rp.plotResiduals, lineNames, init=init, scaleFlux=self.rp.scaleFlux)
 
         return out, components
 
-    def lin_and_multi_gaussian(self, numOfComponents, cList, sList, aList, lS, lI, limits):
-        """All lists should be the same length"""
-        gList = []
-
+    def lin_and_multi_gaussian(self, numOfComponents, cList, sList, aList, lS, lI, limits, plot=False, backend=None, verbose=False):
+        """All lists should be the same length. The fit is only plotted and saved if plot is True.
+        backend is the name of the residual kernels (see fitelp.gaussian_residuals)"""
         if self.xAxis == 'wave' and self.initVals == 'vel':
             cList = vel_to_wave(self.restWave, vel=np.array(cList), flux=0)[0]
             sList = vel_to_wave(self.restWave, vel=np.array(sList), flux=0, delta=True)[0]
@@ -220,11 +341,12 @@ class FittingProfile(object):
             sList = wave_to_vel(self.restWave, wave=np.array(sList), flux=0, delta=True)[0]
             aList = wave_to_vel(self.restWave, wave=0, flux=np.array(aList))[1]
 
-        lin = LinearModel(prefix='lin_')
-        self.linGaussParams = lin.guess(self.flux, x=self.x)
-        self.linGaussParams.update(lin.make_params())
-        self.linGaussParams['lin_slope'].set(lS, vary=True)
-        self.linGaussParams['lin_intercept'].set(lI, vary=True)
+        # Flat parameter vector [slope, intercept, c1, s1, a1, c2, s2, a2, ...]
+        p0 = np.zeros(2 + 3 * numOfComponents)
+        lower = np.full(p0.shape, -np.inf)
+        upper = np.full(p0.shape, np.inf)
+        vary = np.ones(p0.shape, dtype=bool)
+        p0[0], p0[1] = lS, lI
 
         for i in range(numOfComponents):
             if type(limits['c']) is list:
@@ -239,31 +361,82 @@ class FittingProfile(object):
                 aLimit = limits['a'][i]
             else:
                 aLimit = limits['a']
-            lims = {'c': cLimit, 's': sLimit, 'a': aLimit}
-            prefix = 'g{0}_'.format(i+1)
-            gList.append(self._gaussian_component(self.linGaussParams, prefix, cList[i], sList[i], aList[i], lims))
-        gList = np.array(gList)
-        mod = lin + gList.sum()
-
-        init = mod.eval(self.linGaussParams, x=self.x)
-        out = mod.fit(self.flux, self.linGaussParams, x=self.x, weights=self.weights)
-        f = open(os.path.join(constants.OUTPUT_DIR, self.rp.regionName, "{0}_Log.txt".format(self.rp.regionName)), "a")
-        print("######## %s %s Linear and Multi-gaussian Model ##########\n" % (self.rp.regionName, self.lineName))
-        print(out.fit_report())
-        f.write("######## %s %s Linear and Multi-gaussian Model ##########\n" % (self.rp.regionName, self.lineName))
-        f.write(out.fit_report())
-        f.close()
+            for j, (value, limit) in enumerate(((cList[i], cLimit), (sList[i], sLimit), (aList[i], aLimit))):
+                idx = 2 + 3 * i + j
+                p0[idx] = value
+                lower[idx], upper[idx], vary[idx] = component_bounds(value, limit)
+
+        out = self._least_squares_fit(numOfComponents, p0, vary, lower, upper, backend)
+        init = out.init_fit
+        self._log_fit_report(out, verbose)
         components = out.eval_components()
 
-        if not hasattr(self.rp, 'plotResiduals'):
-            self.rp.plotResiduals = True
-        self.plot_emission_line(numOfComponents, components, out, self.rp.plotResiduals, init=init, scaleFlux=self.rp.scaleFlux)
+        if plot:
+            if not hasattr(self.rp, 'plotResiduals'):
+                self.rp.plotResiduals = True
+            self.plot_emission_line(numOfComponents, components, out, self.rp.plotResiduals, init=init, scaleFlux=self.rp.scaleFlux)
 
-        self._get_amplitude(numOfComponents, out)
+        self._get_amplitude(numOfComponents, out, verbose)
 
         return out, components
 
+    def _least_squares_fit(self, numOfComponents, p0, vary, lower, upper, backend=None):
+        """Minimises the weighted residual over the varying parameters. Fixed parameters keep their value in p0"""
+        kernels = get_backend(backend)
+        # The compiled kernels are specialised for contiguous float64 arrays
+        x = np.ascontiguousarray(self.x, dtype=np.float64)
+        flux = np.ascontiguousarray(self.flux, dtype=np.float64)
+        if self.weights is None:
+            weights = np.ones(len(x))
+        else:
+            weights = np.ascontiguousarray(self.weights, dtype=np.float64)
+
+        free = np.flatnonzero(vary)
+        # Clip the initial values into their bounds, as lmfit does
+        p0 = p0.copy()
+        p0[free] = np.clip(p0[free], lower[free], upper[free])
+        p = p0.copy()
+
+        # With every center and sigma fixed the model is linear in the free parameters
+        if not np.any(vary[2::3]) and not np.any(vary[3::3]):
+            return self._linear_least_squares_fit(numOfComponents, x, flux, weights, p0, vary, lower, upper, kernels)
+
+        def residual(q):
+            # least_squares keeps the previous residual while trying a step, so each call needs its own array
+            p[free] = q
+            return kernels.multi_gaussian_residual(p, x, flux, weights, numOfComponents, np.empty(len(x)))
+
+        def jacobian(q):
+            p[free] = q
+            return kernels.multi_gaussian_jacobian(p, x, flux, weights, numOfComponents)[:, free]
+
+        result = least_squares(residual, p0[free], jac=jacobian, bounds=(lower[free], upper[free]), method='trf',
+                               x_scale='jac', tr_solver='exact', ftol=1e-8, xtol=1e-8)
+        p[free] = result.x
+
+        return LinGaussianFit(numOfComponents, x, flux, weights, p0, p.copy(), vary, result.jac, result.nfev, result.message, result.success, kernels)
+
+    def _linear_least_squares_fit(self, numOfComponents, x, flux, weights, p0, vary, lower, upper, kernels):
+        """Fits the slope, intercept and amplitudes by linear least squares when no center or sigma varies"""
+        free = np.flatnonzero(vary)
+        jac = kernels.multi_gaussian_jacobian(p0, x, flux, weights, numOfComponents)[:, free]
+        r0 = kernels.multi_gaussian_residual(p0, x, flux, weights, numOfComponents, np.empty(len(x)))
+
+        if np.all(np.isinf(lower[free])) and np.all(np.isinf(upper[free])):
+            dq = np.linalg.lstsq(jac, -r0, rcond=None)[0]
+            message, success = "Linear least squares solution.", True
+        else:
+            result = lsq_linear(jac, -r0, bounds=(lower[free] - p0[free], upper[free] - p0[free]))
+            dq, message, success = result.x, result.message, result.success
+        p = p0.copy()
+        p[free] += dq
+
+        return LinGaussianFit(numOfComponents, x, flux, weights, p0, p, vary, jac, 1, message, success, kernels)
+
     def plot_emission_line(self, numOfComponents, components, out, plotResiduals=True, lineNames=None, init=None, scaleFlux=1e14):
+        import matplotlib.pyplot as plt
+        from matplotlib.ticker import MaxNLocator
+
         ion, lambdaZero = line_label(self.lineName, self.restWave)
         fig = plt.figure("%s %s %s" % (self.rp.regionName, ion, lambdaZero))
         if plotResiduals is True:
@@ -318,6 +491,8 @@ class FittingProfile(object):
 
 
 def plot_profiles(lineNames, rp, nameForComps='', title='', sortedIndex=None, plotAllComps=False, xAxis='vel', logscale=False, ymin=None):
+    import matplotlib.pyplot as plt
+
     try:
         plt.figure(title)
         ax = plt.subplot(1, 1, 1)
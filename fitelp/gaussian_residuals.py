@@ -0,0 +1,45 @@
+"""Backends for the linear and multi-gaussian emission line model kernels.
+
+The parameters are a flat vector p = [slope, intercept, c1, s1, a1, c2, s2, a2, ...] where c, s and a are the
+center, sigma and amplitude (area) of each of the n gaussian components. The arrays must be C-contiguous float64.
+Each backend is a module providing
+    multi_gaussian_model(p, vel, n): the linear continuum plus the gaussians at each point in vel
+    multi_gaussian_components(p, vel, n, comps): writes the continuum into comps[0] and gaussian i into comps[i + 1]
+        (comps has shape (n + 1, len(vel))) and returns the total model
+    multi_gaussian_residual(p, vel, flux, weights, n, out): writes (flux - model) * weights into out and returns out
+    multi_gaussian_jacobian(p, vel, flux, weights, n): the analytic jacobian of the residual with respect to p (flux is
+        unused, so that it takes the same arguments as the residual)
+
+'cython' is the optional compiled extension fitelp._residual_c (built by setup.py when Cython is installed).
+'numpy' only needs numpy and is always available. 'numba' needs the optional numba dependency and is only used when
+asked for: importing and compiling it takes about 0.4 s per process, far more than it saves over the numpy kernels
+when fitting a region (~0.01 s).
+"""
+import importlib
+from collections import OrderedDict
+
+# In order of preference
+BACKENDS = OrderedDict([('cython', 'fitelp._residual_c'),
+                        ('numpy', 'fitelp._residual_numpy'),
+                        ('numba', 'fitelp._residual_numba')])
+
+_loadedBackends = {}
+
+
+def get_backend(name=None):
+    """Returns the kernel module of the backend called name.
+    If name is None, the first backend in BACKENDS that can be imported is returned."""
+    if name is None:
+        for backendName in BACKENDS:
+            try:
+                return get_backend(backendName)
+            except ImportError:
+                continue
+        raise ImportError("No multi-gaussian backend is available.")
+
+    if name not in BACKENDS:
+        raise ValueError("Invalid backend '%s'. Must be one of %s" % (name, list(BACKENDS.keys())))
+    if name not in _loadedBackends:
+        _loadedBackends[name] = importlib.import_module(BACKENDS[name])
+
+    return _loadedBackends[name]
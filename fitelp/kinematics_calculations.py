@@ -4,9 +4,9 @@ import sys
 import numpy as np
 from fitelp.label_tools import line_label
 from fitelp.read_spectra import GalaxyRegion
-from fitelp.fit_line_profiles import FittingProfile, plot_profiles, vel_to_wave, wave_to_vel
-from fitelp.make_latex_tables import average_velocities_table_to_latex, halpha_regions_table_to_latex, comp_table_to_latex
-from fitelp.bpt_plotting import calc_bpt_points, bpt_plot
+from fitelp.fit_line_profiles import FittingProfile, wave_to_vel
+from fitelp.make_latex_tables import comp_table_to_latex
+from fitelp.bpt_plotting import calc_bpt_points
 import fitelp.constants as constants
 
 constants.init()
@@ -200,8 +200,47 @@ def save_measurements(measurementInfo, rp):
             writer.writerow(["0000", "NO", "0.00", "0", "0", "0.00"])
 
 
-def fit_profiles(rp, xAxis, initVals):
-    galaxyRegion = GalaxyRegion(rp)  # Flux Calibrated
+# Best fit values stored in the emProfiles of each line as (emProfiles key, gaussian parameter name)
+BEST_VALUE_KEYS = (('centerList', 'center'), ('sigmaList', 'sigma'), ('ampListNew', 'amplitude'))
+
+
+def store_best_values(emProfile, model, numComps, prefix='g'):
+    """Stores the best fit center, sigma and amplitude of each component (e.g. 'g1_center' for prefix 'g')"""
+    for key, paramName in BEST_VALUE_KEYS:
+        emProfile[key] = [model.best_values['{0}{1}_{2}'.format(prefix, idx + 1, paramName)] for idx in range(numComps)]
+
+
+def copied_initial_values(rp, emInfo, numComps, xAxis):
+    """Returns the initial centers, sigmas and amplitudes of a line copied from the line(s) in emInfo['copyFrom']"""
+    copyFrom = emInfo['copyFrom']
+    sources = copyFrom if type(copyFrom) is list else [copyFrom] * numComps
+
+    copyCenterList, copySigmaList, copyAmpList = [], [], []
+    for idx, source in enumerate(sources):
+        copyInfo = rp.emProfiles[source]
+        copyCenterList.append(copyInfo['centerList'][idx])
+        copyAmpList.append(copyInfo['ampListNew'][idx])
+        sigIntCopy, _ = calc_vel_dispersion(copyInfo['sigmaList'][idx], 0, copyInfo['sigmaT2'], copyInfo['Filter'], rp)
+        newSigObs, _ = calc_vel_dispersion(sigIntCopy, 0, emInfo['sigmaT2'], emInfo['Filter'], rp, correctCopiedSigma=True)
+        copySigmaList.append(newSigObs)
+
+    if type(emInfo['ampList']) is list:
+        ampListInit = emInfo['ampList']
+    else:
+        ampListInit = [float(a) * emInfo['ampList'] for a in copyAmpList]  # Multiply each copyAmplitude by number
+
+    if xAxis == 'wave':
+        copyRestWaves = np.array([rp.emProfiles[source]['restWavelength'] for source in sources])
+        velCopyCenterList = wave_to_vel(copyRestWaves, wave=np.array(copyCenterList), flux=0)[0]
+        velCopySigmaList = wave_to_vel(copyRestWaves, wave=np.array(copySigmaList), flux=0, delta=True)[0]
+        velAmpListInit = wave_to_vel(copyRestWaves, wave=0, flux=np.array(ampListInit))[1]
+        return velCopyCenterList, velCopySigmaList, velAmpListInit
+
+    return copyCenterList, copySigmaList, ampListInit
+
+
+def fit_profiles(rp, xAxis, initVals, verbose=False):
+    galaxyRegion = GalaxyRegion(rp, verbose)  # Flux Calibrated
     # galaxyRegion.plot_order(21, filt='red', minIndex=1300, maxIndex=1600, title="")
     # plt.show()
 
@@ -210,92 +249,62 @@ def fit_profiles(rp, xAxis, initVals):
     f.write("LOG INFORMATION FOR %s\n" % rp.regionName)
     f.close()
 
+    # Lines without their own numComps use the number of components of their zone
     for emName, emInfo in rp.emProfiles.items():
-        if 'numComps' in emInfo and emInfo['numComps'] is not None:
-            numComps = emInfo['numComps']
-        else:
-            numComps = rp.numComps[emInfo['zone']]
-            rp.emProfiles[emName]['numComps'] = numComps
+        if 'numComps' not in emInfo or emInfo['numComps'] is None:
+            rp.emProfiles[emName]['numComps'] = rp.numComps[emInfo['zone']]
+
+    # Per-line settings as parallel arrays, indexed by the position of the line in emNames. The emProfiles dicts are
+    # still used for the information shared between lines (copyFrom and the best fit values).
+    emNames = list(rp.emProfiles.keys())
+    emInfos = list(rp.emProfiles.values())
+    numLines = len(emNames)
+    orders = np.fromiter((emInfo['Order'] for emInfo in emInfos), dtype=np.int32, count=numLines)
+    filters = np.array([emInfo['Filter'] for emInfo in emInfos])
+    minIs = np.fromiter((emInfo['minI'] for emInfo in emInfos), dtype=np.int64, count=numLines)
+    maxIs = np.fromiter((emInfo['maxI'] for emInfo in emInfos), dtype=np.int64, count=numLines)
+    restWaves = np.fromiter((emInfo['restWavelength'] for emInfo in emInfos), dtype=np.float64, count=numLines)
+    numCompsAll = np.fromiter((emInfo['numComps'] for emInfo in emInfos), dtype=np.int32, count=numLines)
+
+    # Per-line plots are made unless the region turns them off
+    plotFits = getattr(rp, 'plotFits', True)
+
+    # Spectrum slices of every line, looked up order by order, and their velocity grids, computed once before fitting
+    masks = galaxyRegion.mask_emission_lines(orders, filters, minIs, maxIs)
+    if xAxis == 'vel':
+        velGrids = [galaxyRegion.velocity_grid(orders[i], filters[i], minIs[i], maxIs[i], restWaves[i]) for i in range(numLines)]
+    else:
+        velGrids = [None] * numLines
+
+    for i, emName in enumerate(emNames):
+        emInfo = emInfos[i]
+        numComps = int(numCompsAll[i])
+        restWave = restWaves[i]
 
-        print("------------------ %s : %s ----------------" % (rp.regionName, emName))
+        if verbose:
+            print("------------------ %s : %s ----------------" % (rp.regionName, emName))
         f = open(os.path.join(constants.OUTPUT_DIR, rp.regionName, "%s_Log.txt" % rp.regionName), "a")
         f.write("------------------ %s : %s ----------------\n" % (rp.regionName, emName))
         f.close()
-        wave, flux, waveError, fluxError = galaxyRegion.mask_emission_line(emInfo['Order'], filt=emInfo['Filter'],
-                                                                           minIndex=emInfo['minI'],
-                                                                           maxIndex=emInfo['maxI'])
+        wave, flux, waveError, fluxError = masks[i]
 
         if len(emName.split('+')) > 1:
-            fittingProfile = FittingProfile(wave, flux, restWave=emInfo['restWavelength'], lineName=emName, fluxError=fluxError, zone=emInfo['zone'], rp=rp, xAxis=xAxis)
-            model, comps = fittingProfile.multiple_close_emission_lines(lineNames=emInfo['Lines'], cListInit=rp.centerList[emInfo['zone']], sListInit=rp.sigmaList[emInfo['zone']], lS=rp.linSlope[emInfo['zone']], lI=rp.linInt[emInfo['zone']])
+            fittingProfile = FittingProfile(wave, flux, restWave=restWave, lineName=emName, fluxError=fluxError, zone=emInfo['zone'], rp=rp, xAxis=xAxis, vel=velGrids[i])
+            model, comps = fittingProfile.multiple_close_emission_lines(lineNames=emInfo['Lines'], cListInit=rp.centerList[emInfo['zone']], sListInit=rp.sigmaList[emInfo['zone']], lS=rp.linSlope[emInfo['zone']], lI=rp.linInt[emInfo['zone']], plot=plotFits, verbose=verbose)
 
             for line in emInfo['Lines']:
-                lineShort = line.replace('-', '')
-                rp.emProfiles[line]['centerList'] = []
-                rp.emProfiles[line]['sigmaList'] = []
-                rp.emProfiles[line]['ampListNew'] = []
-                for idx in range(numComps):
-                    rp.emProfiles[line]['centerList'].append(model.best_values['g{0}{1}_center'.format(lineShort, (idx + 1))])
-                    rp.emProfiles[line]['sigmaList'].append(model.best_values['g{0}{1}_sigma'.format(lineShort, (idx + 1))])
-                    rp.emProfiles[line]['ampListNew'].append(model.best_values['g{0}{1}_amplitude'.format(lineShort, (idx + 1))])
+                store_best_values(rp.emProfiles[line], model, numComps, prefix='g' + line.replace('-', ''))
 
         else:
-            fittingProfile = FittingProfile(wave, flux, restWave=emInfo['restWavelength'], lineName=emName, fluxError=fluxError, zone=emInfo['zone'], rp=rp, xAxis=xAxis, initVals=initVals)
+            fittingProfile = FittingProfile(wave, flux, restWave=restWave, lineName=emName, fluxError=fluxError, zone=emInfo['zone'], rp=rp, xAxis=xAxis, initVals=initVals, vel=velGrids[i])
 
             if emInfo['copyFrom'] is None:
-                model, comps = fittingProfile.lin_and_multi_gaussian(numComps, rp.centerList[emInfo['zone']], rp.sigmaList[emInfo['zone']], emInfo['ampList'], rp.linSlope[emInfo['zone']], rp.linInt[emInfo['zone']], emInfo['compLimits'])
-                rp.emProfiles[emName]['centerList'] = []
-                rp.emProfiles[emName]['sigmaList'] = []
-                rp.emProfiles[emName]['ampListNew'] = []
-                for idx in range(numComps):
-                    rp.emProfiles[emName]['centerList'].append(model.best_values['g%d_center' % (idx + 1)])
-                    rp.emProfiles[emName]['sigmaList'].append(model.best_values['g%d_sigma' % (idx + 1)])
-                    rp.emProfiles[emName]['ampListNew'].append(model.best_values['g%d_amplitude' % (idx + 1)])
+                cList, sList, aList = rp.centerList[emInfo['zone']], rp.sigmaList[emInfo['zone']], emInfo['ampList']
             else:
-                if type(emInfo['copyFrom']) is list:
-                    copyAmpList, copyCenterList, copySigmaList = [], [], []
-                    for copyIdx in range(len(emInfo['copyFrom'])):
-                        copyFrom = rp.emProfiles[emInfo['copyFrom'][copyIdx]]
-                        copyAmpList.append(copyFrom['ampListNew'][copyIdx])
-                        copyCenterList.append(copyFrom['centerList'][copyIdx])
-                        copySigmaList.append(copyFrom['sigmaList'][copyIdx])
-
-                        sigObsCopy = copyFrom[copyIdx]
-                        sigIntCopy, _ = calc_vel_dispersion(sigObsCopy, 0, copyFrom['sigmaT2'], copyFrom['Filter'], rp)
-                        newSigObs, _ = calc_vel_dispersion(sigIntCopy, 0, emInfo['sigmaT2'], emInfo['Filter'], rp, correctCopiedSigma=True)
-                        copySigmaList.append(newSigObs)
-                else:
-                    copyFrom = rp.emProfiles[emInfo['copyFrom']]
-                    copyAmpList = copyFrom['ampListNew']
-                    copyCenterList = copyFrom['centerList']
-
-                    copySigmaObsList = copyFrom['sigmaList']
-                    copySigmaList = []
-                    for idx in range(numComps):
-                        sigIntCopy, _ = calc_vel_dispersion(copySigmaObsList[idx], 0, copyFrom['sigmaT2'], copyFrom['Filter'], rp)
-                        newSigObs, _ = calc_vel_dispersion(sigIntCopy, 0, emInfo['sigmaT2'], emInfo['Filter'], rp, correctCopiedSigma=True)
-                        copySigmaList.append(newSigObs)
-
-                if type(rp.emProfiles[emName]['ampList']) is list:
-                    ampListInit = emInfo['ampList']
-                else:
-                    ampListInit = [float(a) * emInfo['ampList'] for a in copyAmpList]  # Multiply each copyAmplitude by number
+                cList, sList, aList = copied_initial_values(rp, emInfo, numComps, xAxis)
+            model, comps = fittingProfile.lin_and_multi_gaussian(numComps, cList, sList, aList, rp.linSlope[emInfo['zone']], rp.linInt[emInfo['zone']], emInfo['compLimits'], plot=plotFits, verbose=verbose)
 
-                if xAxis == 'wave':
-                    velCopyCenterList = wave_to_vel(rp.emProfiles[emInfo['copyFrom']]['restWavelength'], wave=np.array(copyCenterList), flux=0)[0]
-                    velCopySigmaList = wave_to_vel(rp.emProfiles[emInfo['copyFrom']]['restWavelength'], wave=np.array(copySigmaList), flux=0, delta=True)[0]
-                    velAmpListInit = wave_to_vel(rp.emProfiles[emInfo['copyFrom']]['restWavelength'], wave=0, flux=np.array(ampListInit))[1]
-                else:
-                    velCopyCenterList, velCopySigmaList, velAmpListInit = copyCenterList, copySigmaList, ampListInit
-                model, comps = fittingProfile.lin_and_multi_gaussian(numComps, velCopyCenterList, velCopySigmaList, velAmpListInit, rp.linSlope[emInfo['zone']], rp.linInt[emInfo['zone']], emInfo['compLimits'])
-
-                rp.emProfiles[emName]['centerList'] = []
-                rp.emProfiles[emName]['sigmaList'] = []
-                rp.emProfiles[emName]['ampListNew'] = []
-                for idx in range(numComps):
-                    rp.emProfiles[emName]['centerList'].append(model.best_values['g%d_center' % (idx + 1)])
-                    rp.emProfiles[emName]['sigmaList'].append(model.best_values['g%d_sigma' % (idx + 1)])
-                    rp.emProfiles[emName]['ampListNew'].append(model.best_values['g%d_amplitude' % (idx + 1)])
+            store_best_values(rp.emProfiles[emName], model, numComps)
         rp.emProfiles[emName]['model'] = model
         rp.emProfiles[emName]['comps'] = comps
         rp.emProfiles[emName]['x'] = fittingProfile.x
@@ -307,7 +316,7 @@ def fit_profiles(rp, xAxis, initVals):
 
 
 class RegionCalculations(object):
-    def __init__(self, rp, xAxis='vel', initVals='vel'):
+    def __init__(self, rp, xAxis='vel', initVals='vel', verbose=False):
         """ Compute kinematics of a region.
 
         Parameters
@@ -319,6 +328,10 @@ class RegionCalculations(object):
         initVals : str
             Interprets the initial values from all the parameters (i.e. center, sigma, amplitude)
             as velocities if initVals='vel' or as wavelengths if initVals='wave'
+        verbose : bool
+            Prints the fit report of each emission line, the component information and the fitted amplitudes
+            (in the add_em_line format) if True. The fit reports are always written to the region's log file.
+            Default is False.
         """
 
         zoneNames = {zone: [] for zone in rp.centerList.keys()}
@@ -326,7 +339,7 @@ class RegionCalculations(object):
         allModelComponents = []
         measurementInfo = []
 
-        emProfiles = fit_profiles(rp, xAxis, initVals)
+        emProfiles = fit_profiles(rp, xAxis, initVals, verbose)
 
         for emName, emInfo in emProfiles.items():
             if len(emName.split('+')) > 1:
@@ -356,7 +369,7 @@ class RegionCalculations(object):
             rp.emProfiles[emName]['compFluxListErr'] = fluxListErr
             rp.emProfiles[emName]['sigIntList'] = []
             for idx in range(numComps):
-                ampComponentList.append(round(rp.emProfiles[emName]['ampListNew'][idx], 7))
+                ampComponentList.append(round(float(rp.emProfiles[emName]['ampListNew'][idx]), 7))
 
                 sigma = o.params['g%d_sigma' % (idx + 1)].value
                 sigmaError = o.params['g%d_sigma' % (idx + 1)].stderr
@@ -385,14 +398,15 @@ class RegionCalculations(object):
         # Create Component Table
         comp_table_to_latex(allModelComponents, rp, paperSize='a4', orientation='portrait', longTable=True, xAxisUnits=xAxis, scaleFlux=rp.scaleFlux)
 
-        print("------------ Component information %s ------------"  % rp.regionName)
-        for mod in allModelComponents:
-            print(mod)
+        if verbose:
+            print("------------ Component information %s ------------"  % rp.regionName)
+            for mod in allModelComponents:
+                print(mod)
 
-        print("------------ List new Amplitude fit parameters with add_em_line format for easy updating of user's code.  %s ----------" % rp.regionName)
-        for ampComps in ampListAll:
-            ampCompsList, emInfo, emName = ampComps[1:4]
-            print("example_region.add_em_line(name='{emName}', plot_color='{emInfo['Colour']}', order={str(emInfo['Order'])}, filter='{emInfo['Filter']}', min_idx={str(emInfo['minI'])}, max_idx={str(emInfo['maxI'])}, rest_wavelength={str(emInfo['restWavelength'])}, num_comps={str(emInfo['numComps'])}, amp_list={str(ampCompsList)}, zone='{emInfo['zone']}', sigma_tsquared={str(emInfo['sigmaT2'])}, comp_limits={str(emInfo['compLimits'])}, copy_from={str(emInfo['copyFrom'])})".replace("inf", "np.inf"))
+            print("------------ List new Amplitude fit parameters with add_em_line format for easy updating of user's code.  %s ----------" % rp.regionName)
+            for ampComps in ampListAll:
+                ampCompsList, emInfo, emName = ampComps[1:4]
+                print(f"example_region.add_em_line(name='{emName}', plot_color='{emInfo['Colour']}', order={str(emInfo['Order'])}, filter='{emInfo['Filter']}', min_idx={str(emInfo['minI'])}, max_idx={str(emInfo['maxI'])}, rest_wavelength={str(emInfo['restWavelength'])}, num_comps={str(emInfo['numComps'])}, amp_list={str(ampCompsList)}, zone='{emInfo['zone']}', sigma_tsquared={str(emInfo['sigmaT2'])}, comp_limits={str(emInfo['compLimits'])}, copy_from={str(emInfo['copyFrom'])})".replace("inf", "np.inf"))
 
         self.bptPoints_NII = calc_bpt_points(rp, plot_type='NII')
         self.bptPoints_SII = calc_bpt_points(rp, plot_type='SII')
@@ -8,7 +8,7 @@ class RegionParameters(object):
     def __init__(self, region_name, blue_spec_file, red_spec_file, blue_spec_error_file, red_spec_error_file, scale_flux,
                  center_list, sigma_list, lin_slope, lin_int, num_comps, component_labels, component_colors,
                  sigma_instr_blue, sigma_inst_red, distance, em_lines_for_avg_vel_calc, plotting_x_range=None,
-                 plot_residuals=True, show_systemic_velocity=False, systemic_velocity=None):
+                 plot_residuals=True, show_systemic_velocity=False, systemic_velocity=None, plot_fits=True):
         """ List information about a region containing multiple emission lines
 
         Parameters
@@ -71,6 +71,9 @@ class RegionParameters(object):
             as the measured velocity minus the systemicVelocity: (velocity - systemicVelocity)
         systemic_velocity : float or None
             Required if show_systemic_velocity is True.
+        plot_fits : bool
+            Whether to plot and save the fit of each emission line. Turning this off speeds up the fitting.
+            Default is True.
         """
 
         self.regionName = region_name
@@ -94,6 +97,7 @@ class RegionParameters(object):
         self.plotResiduals = plot_residuals
         self.showSystemicVelocity = show_systemic_velocity
         self.systemicVelocity = systemic_velocity
+        self.plotFits = plot_fits
 
         self.emProfiles = OrderedDict()
 
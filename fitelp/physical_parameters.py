@@ -1,6 +1,5 @@
 import csv
 import os
-import sys
 import numpy as np
 from fitelp.label_tools import line_name_to_pyneb_format
 
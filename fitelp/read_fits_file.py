@@ -63,8 +63,7 @@ def nonlinearwave(nwave, specstr, verbose=False):
         pmin = float(fields[13])
         pmax = float(fields[14])
         if verbose:
-            print
-            'Dispersion is order-%d cubic spline' % npieces
+            print('Dispersion is order-%d cubic spline' % npieces)
         if len(fields) != 15 + npieces + 3:
             raise ValueError('Bad order-%d spline format (%d fields)' % (npieces, len(fields)))
         coeff = np.asarray(fields[15:], dtype=float)
@@ -91,18 +90,14 @@ def nonlinearwave(nwave, specstr, verbose=False):
         pmax = float(fields[14])
         if verbose:
             if ftype == 1:
-                print
-                'Dispersion is order-%d Chebyshev polynomial' % order
+                print('Dispersion is order-%d Chebyshev polynomial' % order)
             else:
-                print
-                'Dispersion is order-%d Legendre polynomial (NEEDS TEST)' % order
+                print('Dispersion is order-%d Legendre polynomial (NEEDS TEST)' % order)
         if len(fields) != 15 + order:
             # raise ValueError('Bad order-%d polynomial format (%d fields)' % (order, len(fields)))
             if verbose:
-                print
-                'Bad order-%d polynomial format (%d fields)' % (order, len(fields))
-                print
-                "Changing order from %i to %i" % (order, len(fields) - 15)
+                print('Bad order-%d polynomial format (%d fields)' % (order, len(fields)))
+                print("Changing order from %i to %i" % (order, len(fields) - 15))
             order = len(fields) - 15
         coeff = np.asarray(fields[15:], dtype=float)
         # normalized x coordinates
@@ -140,12 +135,10 @@ def readmultispec(fitsfile, reform=True, quiet=False):
     a 3-D array.
     """
 
-    fh = pyfits.open(fitsfile)
-    try:
+    with pyfits.open(fitsfile, memmap=True) as fh:
         header = fh[0].header
-        flux = fh[0].data
-    finally:
-        fh.close()
+        # Copy the data out of the memory map into a native byte order array (FITS data is big-endian)
+        flux = fh[0].data.astype(fh[0].data.dtype.newbyteorder('='))
     temp = flux.shape
     nwave = temp[-1]
     if len(temp) == 1:
@@ -160,21 +153,17 @@ def readmultispec(fitsfile, reform=True, quiet=False):
         cd1_1 = header['cd1_1']
         ctype1 = header['ctype1']
         if ctype1.strip() == 'LINEAR':
-            wavelen = np.zeros((nspec, nwave), dtype=float)
             ww = (np.arange(nwave, dtype=float) + 1 - crpix1) * cd1_1 + crval1
-            for i in range(nspec):
-                wavelen[i, :] = ww
+            wavelen = np.repeat(ww[np.newaxis, :], nspec, axis=0)
             # handle log spacing too
             dcflag = header.get('dc-flag', 0)
             if dcflag == 1:
                 wavelen = 10.0 ** wavelen
                 if not quiet:
-                    print
-                    'Dispersion is linear in log wavelength'
+                    print('Dispersion is linear in log wavelength')
             elif dcflag == 0:
                 if not quiet:
-                    print
-                    'Dispersion is linear'
+                    print('Dispersion is linear')
             else:
                 raise ValueError('Dispersion not linear or log (DC-FLAG=%s)' % dcflag)
 
@@ -229,29 +218,27 @@ def readmultispec(fitsfile, reform=True, quiet=False):
 
     wavelen = np.zeros((nspec, nwave), dtype=float)
     wavefields = [None] * nspec
+    # simple linear or log spacing for all orders at once
+    linear = (wparms[:, 2] == 0) | (wparms[:, 2] == 1)
+    wavelen[linear] = np.arange(nwave, dtype=float) * wparms[linear, 4:5] + wparms[linear, 3:4]
     for i in range(nspec):
         # if i in skipped_orders:
         #    continue
         verbose = (not quiet) and (i == 0)
-        if wparms[i, 2] == 0 or wparms[i, 2] == 1:
-            # simple linear or log spacing
-            wavelen[i, :] = np.arange(nwave, dtype=float) * wparms[i, 4] + wparms[i, 3]
+        if linear[i]:
             if wparms[i, 2] == 1:
                 wavelen[i, :] = 10.0 ** wavelen[i, :]
                 if verbose:
-                    print
-                    'Dispersion is linear in log wavelength'
+                    print('Dispersion is linear in log wavelength')
             elif verbose:
-                print
-                'Dispersion is linear'
+                print('Dispersion is linear')
         else:
             # non-linear wavelengths
             wavelen[i, :], wavefields[i] = nonlinearwave(nwave, specstr[i],
                                                          verbose=verbose)
-        wavelen *= 1.0 + wparms[i, 6]
+        wavelen[i, :] *= 1.0 + wparms[i, 6]
         if verbose:
-            print
-            "Correcting for redshift: z=%f" % wparms[i, 6]
+            print("Correcting for redshift: z=%f" % wparms[i, 6])
     if nspec == 1 and reform:
         # get rid of unity dimensions
         flux = np.squeeze(flux)
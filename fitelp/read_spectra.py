@@ -1,54 +1,64 @@
 import os
 import sys
-import astropy.units as u
-import matplotlib.pyplot as plt
 import numpy as np
 import fitelp.constants as constants
 import fitelp.read_fits_file
+from fitelp.fit_line_profiles import wave_to_vel
 
 constants.init()
 sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../Input_Data_Files'))
 
 
-def read_spectra(filename, scaleFlux):
+def read_spectra(filename, scaleFlux, verbose=False):
     """ Reads spectra from input FITS File
     Stores the wavelength (in Angstroms) in a vector 'x'
-    x and y are an array of the wavelengths and fluxes of each of the orders"""
+    x and y are an array of the wavelengths and fluxes of each of the orders
+    The dispersion information of the file is printed if verbose is True"""
 
     if not os.path.isfile(filename):
         filename = os.path.join(constants.DATA_FILES, filename)
 
-    spectra = fitelp.read_fits_file.readmultispec(filename)
+    spectra = fitelp.read_fits_file.readmultispec(filename, quiet=not verbose)
     x = spectra['wavelen']
-    y = spectra['flux'] * scaleFlux
+    # Fluxes are kept in single precision (as stored in most FITS files), which is ample for the fits and halves the
+    # memory of the spectra. Wavelengths stay in double precision for the velocity conversion.
+    y = spectra['flux'].astype(np.float32, copy=False)
+    y *= np.float32(scaleFlux)  # y is a fresh array owned by this function, so it can be scaled in place
 
-    if len(x.shape) == 1:
-        x = np.array([x])
-        y = np.array([y])
+    # Long-slit spectra have a single order
+    x = np.atleast_2d(x)
+    y = np.atleast_2d(y)
 
     return x, y
 
 
 class GalaxyRegion(object):
-    def __init__(self, rp):
+    def __init__(self, rp, verbose=False):
         """ x is wavelength arrays, y is flux arrays """
-        self.xBlue, self.yBlue = read_spectra(rp.blueSpecFile, rp.scaleFlux)
-        self.xRed, self.yRed = read_spectra(rp.redSpecFile, rp.scaleFlux)
+        self.xBlue, self.yBlue = read_spectra(rp.blueSpecFile, rp.scaleFlux, verbose)
+        self.xRed, self.yRed = read_spectra(rp.redSpecFile, rp.scaleFlux, verbose)
         self.rp = rp
         if rp.blueSpecError is None:
             self.xBlueError, self.yBlueError = (None, None)
         else:
-            self.xBlueError, self.yBlueError = read_spectra(rp.blueSpecError, rp.scaleFlux)
+            self.xBlueError, self.yBlueError = read_spectra(rp.blueSpecError, rp.scaleFlux, verbose)
         if rp.redSpecError is None:
             self.xRedError, self.yRedError = (None, None)
         else:
-            self.xRedError, self.yRedError = read_spectra(rp.redSpecError, rp.scaleFlux)
+            self.xRedError, self.yRedError = read_spectra(rp.redSpecError, rp.scaleFlux, verbose)
+
+        # Slices of the spectra for each (orderNum, filt, minIndex, maxIndex) already requested
+        self._emissionLineMasks = {}
+        # Velocity grids for each (orderNum, filt, minIndex, maxIndex, restWave) already requested
+        self._velocityGrids = {}
 
         if not os.path.exists(os.path.join(constants.OUTPUT_DIR, rp.regionName)):
             os.makedirs(os.path.join(constants.OUTPUT_DIR, rp.regionName))
 
     def plot_order(self, orderNum, filt='red', minIndex=0, maxIndex=-1, title=''):
         """Plots the wavelength vs flux for a particular order. orderNum starts from 0"""
+        import matplotlib.pyplot as plt
+
         orderNum -= 1
         x, y, xE, yE = self._filter_argument(filt)
 
@@ -70,15 +80,36 @@ class GalaxyRegion(object):
         plt.savefig(os.path.join(constants.OUTPUT_DIR, self.rp.regionName, title))
 
     def mask_emission_line(self, orderNum, filt='red', minIndex=0, maxIndex=-1):
-        orderNum -= 1
-        x, y, xE, yE = self._filter_argument(filt)
-        xMask, yMask = x[orderNum][minIndex:maxIndex], y[orderNum][minIndex:maxIndex]
-        if yE is None:
-            xEMask, yEMask = None, None
-        else:
-            xEMask, yEMask = xE[orderNum][minIndex:maxIndex], yE[orderNum][minIndex:maxIndex]
-
-        return xMask, yMask, xEMask, yEMask
+        """Returns views (not copies) of the wavelength, flux and error arrays of an order between minIndex and
+        maxIndex. The slices are cached, so the returned arrays must not be modified in place."""
+        key = (int(orderNum), str(filt), int(minIndex), int(maxIndex))  # numpy and python types share entries
+        if key not in self._emissionLineMasks:
+            orderNum -= 1
+            x, y, xE, yE = self._filter_argument(filt)
+            xMask, yMask = x[orderNum][minIndex:maxIndex], y[orderNum][minIndex:maxIndex]
+            if yE is None:
+                xEMask, yEMask = None, None
+            else:
+                xEMask, yEMask = xE[orderNum][minIndex:maxIndex], yE[orderNum][minIndex:maxIndex]
+            self._emissionLineMasks[key] = (xMask, yMask, xEMask, yEMask)
+
+        return self._emissionLineMasks[key]
+
+    def mask_emission_lines(self, orderNums, filts, minIndices, maxIndices):
+        """Batched mask_emission_line for the parallel sequences orderNums, filts, minIndices and maxIndices.
+        Returns a list of the (wave, flux, waveError, fluxError) views in the order of the requests."""
+        return [self.mask_emission_line(orderNum, filt, minIndex, maxIndex)
+                for orderNum, filt, minIndex, maxIndex in zip(orderNums, filts, minIndices, maxIndices)]
+
+    def velocity_grid(self, orderNum, filt, minIndex, maxIndex, restWave):
+        """Returns the velocities (km/s) relative to restWave of the wavelengths returned by mask_emission_line.
+        The grids are cached, so the returned array must not be modified in place."""
+        key = (orderNum, filt, minIndex, maxIndex, restWave)
+        if key not in self._velocityGrids:
+            wave = self.mask_emission_line(orderNum, filt, minIndex, maxIndex)[0]
+            self._velocityGrids[key] = wave_to_vel(restWave, wave, flux=0)[0]
+
+        return self._velocityGrids[key]
 
     def _filter_argument(self, filt):
         try:
@@ -1,4 +1,4 @@
-from setuptools import setup, find_packages
+from setuptools import setup, find_packages, Extension
 from codecs import open
 from os import path
 
@@ -8,6 +8,14 @@ here = path.abspath(path.dirname(__file__))
 with open(path.join(here, 'README.md'), encoding='utf-8') as f:
     long_description = f.read()
 
+# The Cython residual kernels are optional. Without Cython (or a C compiler) FitELP falls back to the numpy kernels.
+try:
+    from Cython.Build import cythonize
+    ext_modules = cythonize([Extension('fitelp._residual_c', ['fitelp/_residual_c.pyx'],
+                                       extra_compile_args=['-O3', '-ffast-math'], libraries=['m'], optional=True)])
+except ImportError:
+    ext_modules = []
+
 setup(name='FitELP',
     version='0.1.0',
     description='A powerful Python code to perform spectral emission line fits with multiple gaussian components in echelle or long-slit data. ',
@@ -41,6 +49,8 @@ setup(name='FitELP',
     # simple. Or you can use find_packages().
     packages=find_packages(exclude=['contrib', 'docs', 'tests']),
 
+    ext_modules=ext_modules,
+
     # Alternatively, if you want to distribute just a my_module.py, uncomment
     # this:
     #   py_modules=["my_module"],
@@ -49,16 +59,15 @@ setup(name='FitELP',
     # your project is installed. For an analysis of "install_requires" vs pip's
     # requirements files see:
     # https://packaging.python.org/en/latest/requirements.html
-    install_requires=['numpy', 'matplotlib', 'uncertainties', 'lmfit==0.9.10', 'astropy'],
+    install_requires=['numpy', 'scipy', 'matplotlib', 'uncertainties', 'lmfit==0.9.10', 'astropy'],
 
     # List additional groups of dependencies here (e.g. development
     # dependencies). You can install these using the following syntax,
     # for example:
     # $ pip install -e .[dev,test]
-    # extras_require={
-    #     'dev': ['check-manifest'],
-    #     'test': ['coverage'],
-    # },
+    extras_require={
+        'numba': ['numba'],
+    },
 
     # If there are data files included in your packages that need to be
     # installed, specify them here.  If using Python 2.6 or less, then these
@@ -0,0 +1,88 @@
+"""Regression tests for the comp_limits forms accepted by the single line fits (FittingProfile.lin_and_multi_gaussian).
+Run with: python -m unittest discover tests
+"""
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import fitelp.constants as constants
+from fitelp.fit_line_profiles import FittingProfile, component_bounds
+from fitelp.gaussian_residuals import get_backend
+
+
+class _Region(object):
+    """The parts of RegionParameters used by lin_and_multi_gaussian"""
+    regionName = 'limits-test'
+    scaleFlux = 1.
+
+
+class ComponentLimitsTests(unittest.TestCase):
+    def setUp(self):
+        self.outputDir = tempfile.mkdtemp()
+        self._oldOutputDir = constants.OUTPUT_DIR
+        constants.OUTPUT_DIR = self.outputDir
+        os.makedirs(os.path.join(self.outputDir, _Region.regionName))
+
+        # One gaussian (center, sigma, amplitude) on a flat continuum with a little noise
+        self.vel = np.linspace(-600., 600., 400)
+        self.truth = np.array([0., 0.05, -150., 30., -5.])
+        kernels = get_backend()
+        noise = np.random.RandomState(1).normal(0, 1e-3, len(self.vel))
+        flux = kernels.multi_gaussian_model(self.truth, self.vel, 1) + noise
+        self.profile = FittingProfile(self.vel, flux, restWave=6562.82, lineName='test', zone='low', rp=_Region(),
+                                      xAxis='wave', initVals='wave')
+
+    def tearDown(self):
+        constants.OUTPUT_DIR = self._oldOutputDir
+        shutil.rmtree(self.outputDir)
+
+    def fit(self, c, s, a, limits):
+        out, comps = self.profile.lin_and_multi_gaussian(1, [c], [s], [a], 0., 0.05, limits)
+        return out.best_values
+
+    def test_bounds_are_increasing(self):
+        self.assertEqual(component_bounds(-200., 0.5), (-300., -100., True))
+        self.assertEqual(component_bounds(-200., np.inf), (-np.inf, np.inf, True))
+        self.assertEqual(component_bounds(0., np.inf), (-np.inf, np.inf, True))
+        self.assertEqual(component_bounds(10., (20., 5.)), (5., 20., True))
+        self.assertFalse(component_bounds(10., False)[2])
+        self.assertFalse(component_bounds(0., 0.5)[2])
+
+    def test_negative_values_with_free_limits(self):
+        best = self.fit(-140., 25., -4., {'c': np.inf, 's': np.inf, 'a': np.inf})
+        self.assertAlmostEqual(best['g1_center'], -150., delta=1.)
+        self.assertAlmostEqual(best['g1_amplitude'], -5., delta=0.1)
+
+    def test_negative_values_with_free_and_bounded_limits(self):
+        # Free negative center and amplitude in the same trust region fit as a bounded sigma
+        best = self.fit(-140., 25., -4., {'c': np.inf, 's': (10., 50.), 'a': np.inf})
+        self.assertAlmostEqual(best['g1_center'], -150., delta=1.)
+        self.assertAlmostEqual(best['g1_sigma'], 30., delta=1.)
+        self.assertAlmostEqual(best['g1_amplitude'], -5., delta=0.1)
+
+    def test_negative_values_with_fractional_limits(self):
+        best = self.fit(-140., 25., -4., {'c': 0.5, 's': 0.5, 'a': 0.5})
+        self.assertAlmostEqual(best['g1_center'], -150., delta=1.)
+        self.assertAlmostEqual(best['g1_amplitude'], -5., delta=0.1)
+
+    def test_tuple_limit_excluding_initial_value(self):
+        best = self.fit(-100., 25., -4., {'c': (-300., -145.), 's': np.inf, 'a': np.inf})
+        self.assertLessEqual(best['g1_center'], -145.)
+        self.assertGreaterEqual(best['g1_center'], -300.)
+
+    def test_copied_line_amplitude_limits(self):
+        # With the center and sigma fixed only the amplitude and continuum are fitted, by linear least squares
+        for aLimit in (np.inf, 0.5, (-10., -4.5), (-4.5, -10.)):
+            best = self.fit(-150., 30., -4., {'c': False, 's': False, 'a': aLimit})
+            self.assertEqual((best['g1_center'], best['g1_sigma']), (-150., 30.))
+            self.assertAlmostEqual(best['g1_amplitude'], -5., delta=0.1)
+
+    def test_copied_line_amplitude_tuple_excluding_solution(self):
+        # The initial amplitude is clipped into the range and the solution stops at the bound closest to -5
+        best = self.fit(-150., 30., -1., {'c': False, 's': False, 'a': (-3., -2.)})
+        self.assertAlmostEqual(best['g1_amplitude'], -3., places=6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+"""Tests of the residual kernel backends in fitelp.gaussian_residuals.
+Run with: python -m unittest discover tests
+"""
+import unittest
+import numpy as np
+from fitelp.gaussian_residuals import BACKENDS, get_backend
+
+
+def available_backends():
+    backends = {}
+    for name in BACKENDS:
+        try:
+            backends[name] = get_backend(name)
+        except ImportError:
+            pass
+    return backends
+
+
+class KernelTests(unittest.TestCase):
+    def setUp(self):
+        self.vel = np.linspace(-400., 400., 300)
+        self.flux = np.random.RandomState(0).normal(1., 0.1, len(self.vel))
+        self.weights = np.random.RandomState(1).uniform(0.5, 2., len(self.vel))
+        self.p = np.array([1e-4, 0.1, -20., 30., 5., 40., 80., 2., 0., 15., -1.])
+        self.n = 3
+
+    def test_jacobian_matches_central_differences(self):
+        for name, kernels in available_backends().items():
+            jac = kernels.multi_gaussian_jacobian(self.p, self.vel, self.flux, self.weights, self.n)
+            numericJac = np.empty_like(jac)
+            for idx in range(len(self.p)):
+                step = 1e-6 * max(abs(self.p[idx]), 1.)
+                pPlus, pMinus = self.p.copy(), self.p.copy()
+                pPlus[idx] += step
+                pMinus[idx] -= step
+                rPlus = kernels.multi_gaussian_residual(pPlus, self.vel, self.flux, self.weights, self.n, np.empty(len(self.vel)))
+                rMinus = kernels.multi_gaussian_residual(pMinus, self.vel, self.flux, self.weights, self.n, np.empty(len(self.vel)))
+                numericJac[:, idx] = (rPlus - rMinus) / (2 * step)
+            with self.subTest(backend=name):
+                np.testing.assert_allclose(jac, numericJac, rtol=1e-6, atol=1e-8)
+
+    def test_backends_agree(self):
+        backends = available_backends()
+        reference = backends.pop('numpy')
+        refComps = np.empty((self.n + 1, len(self.vel)))
+        refModel = reference.multi_gaussian_components(self.p, self.vel, self.n, refComps)
+        args = (self.p, self.vel, self.flux, self.weights, self.n)
+        for name, kernels in backends.items():
+            with self.subTest(backend=name):
+                comps = np.empty((self.n + 1, len(self.vel)))
+                np.testing.assert_allclose(kernels.multi_gaussian_components(self.p, self.vel, self.n, comps),
+                                           refModel, rtol=1e-12)
+                np.testing.assert_allclose(comps, refComps, rtol=1e-12, atol=1e-14)
+                np.testing.assert_allclose(kernels.multi_gaussian_model(self.p, self.vel, self.n), refModel, rtol=1e-12)
+                np.testing.assert_allclose(kernels.multi_gaussian_residual(*args, out=np.empty(len(self.vel))),
+                                           reference.multi_gaussian_residual(*args, out=np.empty(len(self.vel))),
+                                           rtol=1e-12, atol=1e-14)
+                np.testing.assert_allclose(kernels.multi_gaussian_jacobian(*args),
+                                           reference.multi_gaussian_jacobian(*args), rtol=1e-12, atol=1e-14)
+
+    def test_model_is_sum_of_components(self):
+        for name, kernels in available_backends().items():
+            comps = np.empty((self.n + 1, len(self.vel)))
+            model = kernels.multi_gaussian_components(self.p, self.vel, self.n, comps)
+            with self.subTest(backend=name):
+                np.testing.assert_allclose(comps.sum(axis=0), model, rtol=1e-12)
+                np.testing.assert_allclose(comps[0], self.p[0] * self.vel + self.p[1], rtol=1e-12)
+
+
+class CythonBackendTests(unittest.TestCase):
+    def setUp(self):
+        try:
+            self.kernels = get_backend('cython')
+        except ImportError:
+            self.skipTest("fitelp._residual_c is not built")
+        self.reference = get_backend('numpy')
+        self.vel = np.linspace(-400., 400., 300)
+        self.flux = np.random.RandomState(2).normal(1., 0.1, len(self.vel))
+        self.weights = np.random.RandomState(3).uniform(0.5, 2., len(self.vel))
+        self.p = np.array([1e-4, 0.1, -20., 30., 5., 40., 80., 2.])
+
+    def test_matches_numpy_backend(self):
+        args = (self.p, self.vel, self.flux, self.weights, 2)
+        np.testing.assert_allclose(self.kernels.multi_gaussian_model(self.p, self.vel, 2),
+                                   self.reference.multi_gaussian_model(self.p, self.vel, 2), rtol=1e-12)
+        np.testing.assert_allclose(self.kernels.multi_gaussian_residual(*args, out=np.empty(len(self.vel))),
+                                   self.reference.multi_gaussian_residual(*args, out=np.empty(len(self.vel))),
+                                   rtol=1e-12, atol=1e-14)
+        np.testing.assert_allclose(self.kernels.multi_gaussian_jacobian(*args),
+                                   self.reference.multi_gaussian_jacobian(*args), rtol=1e-12, atol=1e-14)
+
+
+if __name__ == '__main__':
+    unittest.main()